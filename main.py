@@ -1,17 +1,42 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, status, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional, List
 import jwt
 from passlib.context import CryptContext
-from datetime import datetime, timedelta
-import json
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime, timedelta, timezone
+import asyncio
+import hashlib
+import hmac
+import msgpack
+import orjson
 import os
+import time
 from uuid import uuid4
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 load_dotenv()
 
-app = FastAPI(title="Anime Website API")
+# Jalankan background writer selama app hidup. Referensi task disimpan di global karena
+# event loop hanya memegang weak reference (task bisa hilang dikoleksi GC); saat shutdown
+# sisa antrian di-flush supaya write yang sudah dikonfirmasi ke klien tidak terbuang
+_writer_task = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _writer_task
+    _writer_task = asyncio.create_task(_storage_writer())
+    yield
+    _writer_task.cancel()
+    try:
+        await _writer_task
+    except asyncio.CancelledError:
+        pass
+    _flush_writes()
+
+app = FastAPI(title="Anime Website API", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 # Konfigurasi Security
 SECRET_KEY = os.getenv("SECRET_KEY")
@@ -21,104 +46,338 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Key material dan daftar algoritma disiapkan sekali di import, bukan per panggilan
+HS256_KEY = SECRET_KEY.encode()
+JWT_ALGORITHMS = [ALGORITHM]
+
+# argon2id lebih murah per-verify daripada bcrypt pada tingkat keamanan setara;
+# bcrypt tetap terdaftar supaya hash lama masih bisa diverifikasi (dan di-rehash saat login)
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__time_cost=2,
+    argon2__memory_cost=19456,
+    argon2__parallelism=1,
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# JSON Storage
+# Hash dummy untuk login dengan username yang tidak terdaftar: verifikasi tetap dijalankan
+# supaya waktu respons /token tidak membocorkan keberadaan akun (timing attack). Dummy
+# disediakan untuk kedua skema: selama masih ada user ber-hash bcrypt, dummy bcrypt yang
+# dipakai supaya username lama yang ada dan yang tidak ada memakan waktu yang sama
+DUMMY_HASH_ARGON2 = pwd_context.hash("x")
+DUMMY_HASH_BCRYPT = pwd_context.handler("bcrypt").hash("x")
+# Jumlah user yang hash-nya masih bcrypt; dihitung saat load, berkurang saat rehash login
+_bcrypt_users = 0
+
+def _dummy_hash():
+    return DUMMY_HASH_BCRYPT if _bcrypt_users else DUMMY_HASH_ARGON2
+
+# Cache hasil verifikasi bcrypt sebentar supaya login berulang dari user yang sama tidak
+# membayar ulang ~100ms bcrypt tiap kali. Key berupa sha256(password + hash) sehingga
+# plaintext tidak pernah tersimpan di memori
+_VERIFY_CACHE_TTL = 60
+_VERIFY_CACHE_MAX = 1024
+_verify_cache = {}
+
+def verify_password(password, password_hash):
+    key = hashlib.sha256(password.encode() + password_hash.encode()).digest()
+    now = time.monotonic()
+    cached = _verify_cache.get(key)
+    if cached is not None and cached[2] > now and hmac.compare_digest(cached[0], key):
+        return cached[1]
+    result = pwd_context.verify(password, password_hash)
+    if len(_verify_cache) >= _VERIFY_CACHE_MAX:
+        _verify_cache.clear()
+    _verify_cache[key] = (key, result, now + _VERIFY_CACHE_TTL)
+    return result
+
+# Storage on-disk: MessagePack (biner, lebih kecil dan lebih cepat di-parse daripada
+# JSON ber-indent) atau "json" untuk debugging
+STORAGE_FORMAT = "msgpack"
+
 DATA_DIR = "data"
-USERS_FILE = os.path.join(DATA_DIR, "users.json")
-POSTS_FILE = os.path.join(DATA_DIR, "posts.json")
+USERS_FILE = os.path.join(DATA_DIR, "users.msgpack")
+POSTS_FILE = os.path.join(DATA_DIR, "posts.msgpack")
+# File JSON lama, dibaca sekali untuk migrasi jika file msgpack belum ada
+LEGACY_USERS_FILE = os.path.join(DATA_DIR, "users.json")
+LEGACY_POSTS_FILE = os.path.join(DATA_DIR, "posts.json")
 
 # Membuat direktori data jika belum ada
 os.makedirs(DATA_DIR, exist_ok=True)
 
-# Inisialisasi file JSON jika belum ada
-def init_json_files():
+# Cache in-memory, dimuat sekali saat startup supaya tidak parse ulang file per request
+USERS_BY_ID = {}
+USERS_BY_USERNAME = {}
+USERS_BY_EMAIL = {}
+POSTS_LIST = []
+# Posisi tiap post di POSTS_LIST (stabil karena append-only), untuk cursor pagination O(1)
+POST_INDEX_BY_ID = {}
+
+# Inisialisasi file storage jika belum ada (migrasi dari format lama bila perlu),
+# lalu muat ke cache in-memory
+def init_store_files():
     if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'w') as f:
-            json.dump([], f)
-    if not os.path.exists(POSTS_FILE):
-        with open(POSTS_FILE, 'w') as f:
-            json.dump([], f)
+        if os.path.exists(LEGACY_USERS_FILE):
+            with open(LEGACY_USERS_FILE, 'rb') as f:
+                write_store(USERS_FILE, orjson.loads(f.read()))
+        else:
+            write_store(USERS_FILE, [])
+
+    if not os.path.exists(POSTS_FILE) and os.path.exists(LEGACY_POSTS_FILE):
+        with open(LEGACY_POSTS_FILE, 'rb') as f:
+            for record in orjson.loads(f.read()):
+                append_record(POSTS_FILE, record)
+    # File log kosong sah-sah saja; cukup pastikan ada
+    open(POSTS_FILE, 'ab').close()
+
+    for user in read_store(USERS_FILE):
+        USERS_BY_ID[user["id"]] = user
+        USERS_BY_USERNAME[user["username"]] = user
+        USERS_BY_EMAIL[user["email"]] = user
+    global _bcrypt_users
+    _bcrypt_users = sum(1 for u in USERS_BY_ID.values() if u["password"].startswith("$2"))
 
-init_json_files()
+    # `torn` = ekor log terpotong karena crash; log ditulis ulang sampai batas record
+    # utuh terakhir supaya append berikutnya selalu mulai dari batas yang bersih
+    posts, torn = read_record_log(POSTS_FILE)
+    rewrite = torn
+    # Migrasi file snapshot lama (satu array utuh) ke log per-record
+    if len(posts) == 1 and isinstance(posts[0], list):
+        posts = posts[0]
+        rewrite = True
+    # Seragamkan created_at era string ISO (dianggap UTC) ke epoch milliseconds supaya
+    # satu halaman respons tidak mencampur dua tipe untuk field yang sama
+    for record in posts:
+        if isinstance(record.get("created_at"), str):
+            parsed = datetime.fromisoformat(record["created_at"].replace('Z', '+00:00'))
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=timezone.utc)
+            record["created_at"] = int(parsed.timestamp() * 1000)
+            rewrite = True
+    if rewrite:
+        rewrite_record_log(POSTS_FILE, posts)
+    POSTS_LIST.extend(posts)
+    for index, post in enumerate(POSTS_LIST):
+        POST_INDEX_BY_ID[post["id"]] = index
 
-# Models
+# Models (Pydantic v2, validasi berjalan di pydantic-core berbasis Rust)
 class UserCreate(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     username: str
     email: str
     password: str
 
 class User(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     id: str
     username: str
     email: str
 
 class PostCreate(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     title: str
     embed_url: str
     description: Optional[str] = None
 
 class Post(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     id: str
     title: str
     embed_url: str
     description: Optional[str] = None
     user_id: str
-    created_at: datetime
+    # Epoch milliseconds, sesuai yang benar-benar dikirim endpoint
+    created_at: int
+
+# Paksa kompilasi skema validator saat import, bukan saat request pertama
+UserCreate.model_rebuild()
+User.model_rebuild()
+PostCreate.model_rebuild()
+Post.model_rebuild()
+
+# Storage Functions: dispatch antara msgpack (default) dan orjson sesuai STORAGE_FORMAT
+def read_store(file_path):
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    if STORAGE_FORMAT == "msgpack":
+        return msgpack.unpackb(raw, raw=False)
+    return orjson.loads(raw)
+
+# Tulis satu buffer dengan satu os.write ke file sementara; fsync + os.replace menjamin
+# file final selalu utuh walau proses mati di tengah jalan
+def _write_atomic(file_path, buf):
+    tmp_path = file_path + ".tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, buf)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, file_path)
+
+def write_store(file_path, data):
+    if STORAGE_FORMAT == "msgpack":
+        buf = msgpack.packb(data, datetime=True)
+    else:
+        buf = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NAIVE_UTC)
+    _write_atomic(file_path, buf)
+
+# Posts dipersist sebagai log append-only: satu record per entri, insert cukup satu
+# write O_APPEND tanpa read-modify-write seluruh file
+def append_record(file_path, record):
+    if STORAGE_FORMAT == "msgpack":
+        buf = msgpack.packb(record, datetime=True)
+    else:
+        buf = orjson.dumps(record) + b'\n'
+    with open(file_path, 'ab') as f:
+        f.write(buf)
+
+# Baca log sampai batas record utuh terakhir. Crash di tengah append_record meninggalkan
+# ekor terpotong; kembalikan juga flag-nya supaya caller menulis ulang log sampai batas
+# yang bersih sebelum ada append baru (append sesudah byte sampah merusak log permanen)
+def read_record_log(file_path):
+    records = []
+    torn = False
+    with open(file_path, 'rb') as f:
+        if STORAGE_FORMAT == "msgpack":
+            size = os.fstat(f.fileno()).st_size
+            unpacker = msgpack.Unpacker(f, raw=False)
+            consumed = 0
+            try:
+                for record in unpacker:
+                    # Record snapshot-era berupa list; tipe lain berarti Unpacker
+                    # resync ke tengah byte sampah
+                    if not isinstance(record, (dict, list)):
+                        break
+                    records.append(record)
+                    consumed = unpacker.tell()
+            except (msgpack.exceptions.UnpackException, ValueError):
+                pass
+            torn = consumed != size
+        else:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    torn = True
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    record = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    torn = True
+                    break
+                if not isinstance(record, (dict, list)):
+                    torn = True
+                    break
+                records.append(record)
+    return records, torn
 
-# JSON Storage Functions
-def read_json(file_path):
-    with open(file_path, 'r') as f:
-        return json.load(f)
+# Tulis ulang seluruh log secara atomic (idiom temp + os.replace yang sama dengan write_store)
+def rewrite_record_log(file_path, records):
+    if STORAGE_FORMAT == "msgpack":
+        buf = b''.join(msgpack.packb(record, datetime=True) for record in records)
+    else:
+        buf = b''.join(orjson.dumps(record) + b'\n' for record in records)
+    _write_atomic(file_path, buf)
 
-def write_json(file_path, data):
-    with open(file_path, 'w') as f:
-        json.dump(data, indent=2, default=str)
+# Hanya store user yang masih berupa snapshot utuh; posts memakai log append-only
+def _persist(file_path):
+    if file_path == USERS_FILE:
+        write_store(file_path, list(USERS_BY_ID.values()))
+
+# Antrian write-behind: handler cukup mutasi cache lalu enqueue, background task yang menulis ke disk
+_write_queue: asyncio.Queue = asyncio.Queue()
+
+def schedule_write(file_path):
+    _write_queue.put_nowait(file_path)
+
+async def _storage_writer():
+    while True:
+        pending = {await _write_queue.get()}
+        # Gabungkan write yang menumpuk jadi satu snapshot per file
+        while not _write_queue.empty():
+            pending.add(_write_queue.get_nowait())
+        for file_path in pending:
+            await asyncio.to_thread(_persist, file_path)
+
+# Dipanggil saat shutdown: kuras antrian lalu tulis snapshot user tanpa syarat — item
+# yang terlanjur diambil writer sebelum ter-cancel sudah tidak ada lagi di antrian, dan
+# _persist memotret state hidup terkini sehingga menulis ulang selalu aman
+def _flush_writes():
+    while not _write_queue.empty():
+        _write_queue.get_nowait()
+    _persist(USERS_FILE)
+
+init_store_files()
 
 # Security functions
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, HS256_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Cache token -> User sebentar: request beruntun dengan token yang sama cukup satu
+# dict lookup, tanpa mengulang HMAC + decode JSON. TTL jauh di bawah umur token
+_TOKEN_CACHE_TTL = 30
+_TOKEN_CACHE_MAX = 10_000
+_token_cache = {}
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    now = time.monotonic()
+    cached = _token_cache.get(token)
+    if cached is not None and cached[2] > now and hmac.compare_digest(cached[0], token):
+        return cached[1]
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        
-        users = read_json(USERS_FILE)
-        user = next((u for u in users if u["id"] == user_id), None)
-        
-        if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        return User(id=user["id"], username=user["username"], email=user["email"])
-    except jwt.JWTError:
+        payload = jwt.decode(token, HS256_KEY, algorithms=JWT_ALGORITHMS)
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
+    user_id = payload.get("sub")
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+
+    user = USERS_BY_ID.get(user_id)
+
+    if user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+
+    current_user = User(id=user["id"], username=user["username"], email=user["email"])
+    if len(_token_cache) >= _TOKEN_CACHE_MAX:
+        _token_cache.clear()
+    _token_cache[token] = (token, current_user, now + _TOKEN_CACHE_TTL)
+    return current_user
+
 # Routes
 @app.post("/register", response_model=User)
 async def register(user: UserCreate):
-    users = read_json(USERS_FILE)
-    
     # Check if username or email already exists
-    if any(u["username"] == user.username or u["email"] == user.email for u in users):
+    if user.username in USERS_BY_USERNAME or user.email in USERS_BY_EMAIL:
         raise HTTPException(status_code=400, detail="Username or email already registered")
-    
-    # Create new user
+
+    # Create new user; hashing berjalan di threadpool supaya tidak memblokir event loop
     user_dict = {
-        "id": str(uuid4()),
+        "id": uuid4().hex,
         "username": user.username,
         "email": user.email,
-        "password": pwd_context.hash(user.password)
+        "password": await run_in_threadpool(pwd_context.hash, user.password)
     }
-    
-    users.append(user_dict)
-    write_json(USERS_FILE, users)
+
+    # Cek ulang setelah await: register lain bisa saja masuk selama hashing berjalan
+    if user.username in USERS_BY_USERNAME or user.email in USERS_BY_EMAIL:
+        raise HTTPException(status_code=400, detail="Username or email already registered")
+
+    USERS_BY_ID[user_dict["id"]] = user_dict
+    USERS_BY_USERNAME[user_dict["username"]] = user_dict
+    USERS_BY_EMAIL[user_dict["email"]] = user_dict
+    schedule_write(USERS_FILE)
     
     return User(
         id=user_dict["id"],
@@ -128,61 +387,83 @@ async def register(user: UserCreate):
 
 @app.post("/token")
 async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    users = read_json(USERS_FILE)
-    user = next((u for u in users if u["username"] == form_data.username), None)
-    
-    if not user or not pwd_context.verify(form_data.password, user["password"]):
+    user = USERS_BY_USERNAME.get(form_data.username)
+
+    # Selalu verifikasi terhadap sebuah hash dan gabungkan hasilnya tanpa short-circuit,
+    # supaya jalur user-tidak-ada dan password-salah memakan waktu yang sama
+    password_ok = await run_in_threadpool(verify_password, form_data.password, user["password"] if user else _dummy_hash())
+    ok = password_ok & (user is not None)
+    if not hmac.compare_digest(b"1" if ok else b"0", b"1"):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+
+    # Migrasi hash lama (bcrypt) ke skema preferensi saat login berhasil
+    if pwd_context.needs_update(user["password"]):
+        user["password"] = await run_in_threadpool(pwd_context.hash, form_data.password)
+        global _bcrypt_users
+        _bcrypt_users = max(0, _bcrypt_users - 1)
+        schedule_write(USERS_FILE)
+
     access_token = create_access_token(data={"sub": user["id"]})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @app.post("/posts", response_model=Post)
 async def create_post(post: PostCreate, current_user: User = Depends(get_current_user)):
-    posts = read_json(POSTS_FILE)
-    
     post_dict = {
-        "id": str(uuid4()),
+        "id": uuid4().hex,
         "title": post.title,
         "embed_url": post.embed_url,
         "description": post.description,
         "user_id": current_user.id,
-        "created_at": str(datetime.utcnow())
+        # Epoch milliseconds: tidak ada format/parse string tanggal di hot path
+        "created_at": int(time.time() * 1000)
     }
-    
-    posts.append(post_dict)
-    write_json(POSTS_FILE, posts)
-    
-    return Post(
-        id=post_dict["id"],
-        title=post_dict["title"],
-        embed_url=post_dict["embed_url"],
-        description=post_dict["description"],
-        user_id=post_dict["user_id"],
-        created_at=datetime.fromisoformat(post_dict["created_at"].replace('Z', '+00:00'))
-    )
+
+    POST_INDEX_BY_ID[post_dict["id"]] = len(POSTS_LIST)
+    POSTS_LIST.append(post_dict)
+    append_record(POSTS_FILE, post_dict)
+
+    global _posts_version
+    _posts_version += 1
+    _posts_cache.clear()
+
+    # Dict-nya kita yang bangun sendiri, tidak perlu divalidasi ulang oleh Pydantic;
+    # response_model di decorator tinggal untuk skema OpenAPI
+    return ORJSONResponse(post_dict)
+
+# Cache respons GET /posts: body JSON siap kirim per kombinasi parameter. Nomor versi
+# ikut jadi bagian key dan naik setiap ada post baru, jadi entri basi otomatis miss
+_POSTS_CACHE_MAX = 64
+_posts_version = 0
+_posts_cache = {}
 
 @app.get("/posts", response_model=List[Post])
-async def get_posts(skip: int = 0, limit: int = 10):
-    posts = read_json(POSTS_FILE)
-    
-    # Simple pagination
-    paginated_posts = posts[skip:skip + limit]
-    
-    return [
-        Post(
-            id=post["id"],
-            title=post["title"],
-            embed_url=post["embed_url"],
-            description=post["description"],
-            user_id=post["user_id"],
-            created_at=datetime.fromisoformat(post["created_at"].replace('Z', '+00:00'))
-        ) for post in paginated_posts
-    ]
+async def get_posts(skip: int = 0, limit: int = 10, after: Optional[str] = None):
+    cache_key = (skip, limit, after, _posts_version)
+    body = _posts_cache.get(cache_key)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
+
+    # Keyset pagination: `after` = id post terakhir dari halaman sebelumnya, start dicari
+    # lewat index posisi (O(1)) sehingga biaya tidak tumbuh seiring dalamnya halaman.
+    # `skip` tetap didukung untuk kompatibilitas klien lama
+    if after is not None:
+        last_index = POST_INDEX_BY_ID.get(after)
+        if last_index is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        skip = last_index + 1
+
+    # Record di cache sudah berupa dict siap kirim; serialisasi sekali dengan orjson tanpa
+    # validasi Pydantic per baris, lalu simpan body-nya untuk request berikutnya.
+    # response_model di decorator dipertahankan hanya untuk skema OpenAPI
+    body = orjson.dumps(POSTS_LIST[skip:skip + limit])
+    if len(_posts_cache) >= _POSTS_CACHE_MAX:
+        _posts_cache.clear()
+    _posts_cache[cache_key] = body
+    return Response(content=body, media_type="application/json")
 
 # Untuk deployment di Vercel
 def create_app():
@@ -190,4 +471,14 @@ def create_app():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # uvloop (event loop berbasis C) + httptools (parser HTTP C); reload dimatikan karena
+    # mode ini untuk production. Tetap satu worker: seluruh state (cache user/post, cursor,
+    # antrian write-behind) hidup per-proses, multi-worker butuh store bersama dulu
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=1,
+        loop="uvloop",
+        http="httptools",
+    )
\ No newline at end of file